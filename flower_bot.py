@@ -4,12 +4,16 @@
 # Run: python3 flower_bot.py
 
 import asyncio
+import contextlib
+import functools
 import logging
 import os
 import re
-import uuid
+import secrets
+import sqlite3
+import time
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.client.default import DefaultBotProperties
@@ -28,6 +32,11 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 import aiosqlite
 from dotenv import load_dotenv
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
 )
@@ -37,13 +46,13 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 PROVIDER_TOKEN = os.getenv("PROVIDER_TOKEN", "")
 
 
-def _parse_ids(env_value: str):
-    ids = []
-    for part in env_value.split(","):
-        part = part.split("#", 1)[0].strip()
-        if part.isdigit():
-            ids.append(int(part))
-    return ids
+# Comma-separated IDs, each optionally followed by a "# comment". Anchored to
+# the whole value (not per line), matching the old split(",") parser.
+_ID_RE = re.compile(r"(?:\A|,)\s*(\d+)(?=\s*(?:#|,|\Z))")
+
+
+def _parse_ids(env_value: str) -> frozenset[int]:
+    return frozenset(int(x) for x in _ID_RE.findall(env_value))
 
 
 ADMIN_IDS = _parse_ids(os.getenv("ADMIN_IDS", ""))
@@ -71,8 +80,28 @@ class Bouquet:
     in_stock: bool
 
 
-CREATE_SQL = """
-PRAGMA journal_mode=WAL;
+PAGE_SIZE = 8192
+
+# Applied per connection (not part of the schema script), one statement each.
+# page_size must precede journal_mode=WAL: it only takes effect on a new file.
+PRAGMAS = (
+    f"PRAGMA page_size={PAGE_SIZE}",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Schema migrations in order: MIGRATIONS[n - 1] takes a database from
+# user_version n - 1 to n. Append new steps; never edit applied ones.
+MIGRATIONS = (
+    # v1: base schema. Databases from before versioning already have an
+    # orders table with an ISO-text created_at; it is rebuilt with Unix
+    # timestamps (numeric strings written in between are cast back).
+    """
 CREATE TABLE IF NOT EXISTS bouquets (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   number INTEGER NOT NULL,
@@ -83,7 +112,7 @@ CREATE TABLE IF NOT EXISTS bouquets (
   in_stock INTEGER NOT NULL DEFAULT 1
 );
 CREATE UNIQUE INDEX IF NOT EXISTS idx_b_unique ON bouquets(size, number);
-CREATE TABLE IF NOT EXISTS orders (
+CREATE TABLE orders_v1 (
   id TEXT PRIMARY KEY,
   user_id INTEGER NOT NULL,
   bouquet_id INTEGER NOT NULL,
@@ -91,10 +120,81 @@ CREATE TABLE IF NOT EXISTS orders (
   delivery_time TEXT NOT NULL,
   status TEXT NOT NULL DEFAULT 'pending_payment',
   total_u INTEGER NOT NULL,
-  created_at TEXT NOT NULL,
+  created_at INTEGER NOT NULL,
   FOREIGN KEY(bouquet_id) REFERENCES bouquets(id)
 );
-"""
+CREATE TABLE IF NOT EXISTS orders (
+  id, user_id, bouquet_id, address, delivery_time, status, total_u, created_at
+);
+INSERT INTO orders_v1(
+  id, user_id, bouquet_id, address, delivery_time, status, total_u, created_at
+)
+SELECT id, user_id, bouquet_id, address, delivery_time, status, total_u,
+  CASE
+    WHEN typeof(created_at) = 'integer' THEN created_at
+    WHEN created_at <> '' AND created_at NOT GLOB '*[^0-9]*'
+      THEN CAST(created_at AS INTEGER)
+    ELSE COALESCE(CAST(strftime('%s', created_at) AS INTEGER), 0)
+  END
+FROM orders;
+DROP TABLE orders;
+ALTER TABLE orders_v1 RENAME TO orders;
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_bouquet ON orders(bouquet_id);
+""",
+    # v2: covering index for the /myorders query, so the orders table itself
+    # is never read
+    """
+DROP INDEX IF EXISTS idx_orders_user_created;
+CREATE INDEX idx_orders_user_cover
+  ON orders(user_id, created_at DESC, id, status, total_u, bouquet_id);
+""",
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Hot queries as fixed strings: sqlite3 keeps compiled statements in a
+# per-connection cache keyed by SQL text, so they're prepared only once.
+SQL_IN_STOCK = (
+    "SELECT id, number, title, price_u, file_id FROM bouquets "
+    "WHERE size=? AND in_stock=1 ORDER BY number LIMIT 30"
+)
+# Column order matches Bouquet's fields.
+SQL_BY_NUM = (
+    "SELECT id, number, size, title, price_u, file_id, in_stock FROM bouquets "
+    "WHERE size=? AND number=?"
+)
+SQL_INSERT_ORDER = (
+    "INSERT INTO orders(id,user_id,bouquet_id,address,delivery_time,total_u,created_at) "
+    "VALUES(?,?,?,?,?,?,CAST(strftime('%s','now') AS INTEGER))"
+)
+SQL_USER_ORDERS = (
+    "SELECT o.id, o.status, o.total_u, o.created_at, b.title, b.size, b.number "
+    "FROM orders o JOIN bouquets b ON b.id = o.bouquet_id "
+    "WHERE o.user_id=? ORDER BY o.created_at DESC LIMIT 10"
+)
+ORDER_LINE = (
+    "#<b>{id}</b> — {title} ({hsize}, #{num})\n"
+    "Status: {status} • Total: ${total} • {created:%Y-%m-%d %H:%M}"
+).format
+# Whole admin listing as one newline-joined string (NULL when empty).
+_ADMIN_LINE_SQL = (
+    "CASE WHEN in_stock THEN '✅ ' ELSE '❌ ' END || UPPER(size) || ' #' || number"
+    " || ' — ' || title || ' — $' || price_u || ' (id:' || id || ')'"
+)
+if sqlite3.sqlite_version_info >= (3, 44, 0):
+    SQL_ADMIN_LIST = (
+        f"SELECT GROUP_CONCAT({_ADMIN_LINE_SQL}, char(10) ORDER BY size, number) "
+        "FROM bouquets"
+    )
+else:
+    # Aggregate ORDER BY needs SQLite 3.44+. Older versions rely on GROUP_CONCAT
+    # keeping the subquery's order, which SQLite does but doesn't guarantee.
+    SQL_ADMIN_LIST = (
+        f"SELECT GROUP_CONCAT({_ADMIN_LINE_SQL}, char(10)) "
+        "FROM (SELECT * FROM bouquets ORDER BY size, number)"
+    )
+
+TG_MESSAGE_LIMIT = 4096
 
 
 class OrderStates(StatesGroup):
@@ -103,7 +203,7 @@ class OrderStates(StatesGroup):
     waiting_time = State()
 
 
-def main_menu():
+def _build_main_menu():
     kb = ReplyKeyboardBuilder()
     kb.button(text="Catalog")
     kb.button(text="My orders")
@@ -113,15 +213,32 @@ def main_menu():
     return kb.as_markup(resize_keyboard=True)
 
 
-def size_keyboard() -> InlineKeyboardMarkup:
+def _build_size_keyboard(prefix: str = "size:") -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     for s in SIZES:
-        kb.button(text=HUMAN_SIZE[s], callback_data=f"size:{s}")
+        kb.button(text=HUMAN_SIZE[s], callback_data=f"{prefix}{s}")
     kb.adjust(3)
     return kb.as_markup()
 
 
-def numbers_keyboard(nums: list[int]) -> InlineKeyboardMarkup:
+def _build_admin_menu():
+    kb = ReplyKeyboardBuilder()
+    kb.button(text="➕ Add bouquet")
+    kb.button(text="📦 Bouquet list")
+    kb.button(text="⬅️ Menu")
+    kb.adjust(2)
+    return kb.as_markup(resize_keyboard=True)
+
+
+# Static keyboards only depend on SIZES/ADMIN_IDS, so build them once.
+MAIN_MENU = _build_main_menu()
+SIZE_KEYBOARD = _build_size_keyboard()
+ADMIN_SIZE_KEYBOARD = _build_size_keyboard("admin:add:size:")
+ADMIN_MENU = _build_admin_menu()
+
+
+@functools.lru_cache(maxsize=32)
+def numbers_keyboard(nums: tuple[int, ...]) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     for n in nums:
         kb.button(text=str(n), callback_data=f"pick:{n}")
@@ -129,62 +246,158 @@ def numbers_keyboard(nums: list[int]) -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
-# --- DB helpers (new connection each time to avoid threading bug) ---
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript(CREATE_SQL)
-        await db.commit()
+# InputMedia types are mutable pydantic models in aiogram 3.13, and these
+# instances are shared between concurrent handlers: never mutate them.
+@functools.lru_cache(maxsize=256)
+def _media(file_id: str) -> InputMediaPhoto:
+    return InputMediaPhoto(media=file_id)
 
 
-async def get_in_stock_by_size(size: str) -> list[Bouquet]:
-    async with aiosqlite.connect(DB_PATH) as db:
+# --- DB helpers (shared connections, opened in on_startup) ---
+# Under WAL readers don't block on the writer, but each aiosqlite connection
+# serializes its calls, so reads and writes get a connection each.
+DB_READ: aiosqlite.Connection
+DB_WRITE: aiosqlite.Connection
+
+
+async def _connect() -> aiosqlite.Connection:
+    db = await aiosqlite.connect(DB_PATH)
+    try:
         db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM bouquets WHERE size=? AND in_stock=1 ORDER BY number",
-            (size,),
-        )
-        rows = await cur.fetchall()
-    return [
-        Bouquet(
-            id=r["id"],
-            number=r["number"],
-            size=r["size"],
-            title=r["title"],
-            price_u=r["price_u"],
-            file_id=r["file_id"],
-            in_stock=bool(r["in_stock"]),
-        )
-        for r in rows
-    ]
+        for pragma in PRAGMAS:
+            await db.execute(pragma)
+    except BaseException:
+        await db.close()
+        raise
+    return db
+
+
+async def init_db():
+    global DB_READ, DB_WRITE
+    DB_WRITE = await _connect()
+    read = None
+    # aiosqlite runs each connection on a non-daemon thread: close whatever
+    # was opened if startup fails, or the process never exits.
+    try:
+        cur = await DB_WRITE.execute("PRAGMA page_size")
+        (page_size,) = await cur.fetchone()
+        if page_size != PAGE_SIZE:
+            # Existing WAL files keep their page size until rebuilt outside WAL.
+            await DB_WRITE.execute("PRAGMA journal_mode=DELETE")
+            await DB_WRITE.execute(f"PRAGMA page_size={PAGE_SIZE}")
+            await DB_WRITE.execute("VACUUM")
+            await DB_WRITE.execute("PRAGMA journal_mode=WAL")
+        cur = await DB_WRITE.execute("PRAGMA user_version")
+        (version,) = await cur.fetchone()
+        if version < SCHEMA_VERSION:
+            # Table rebuilds copy rows that the pre-versioning bot never checked
+            # against foreign keys; the pragma is a no-op inside a transaction.
+            await DB_WRITE.execute("PRAGMA foreign_keys=OFF")
+            for v in range(version + 1, SCHEMA_VERSION + 1):
+                # Each step and its version stamp commit together
+                await DB_WRITE.executescript(
+                    f"BEGIN;{MIGRATIONS[v - 1]}PRAGMA user_version={v};COMMIT;"
+                )
+            cur = await DB_WRITE.execute("PRAGMA foreign_key_check")
+            for table, rowid, parent, _ in await cur.fetchall():
+                logging.warning(
+                    "Kept %s row %s: its %s reference is missing", table, rowid, parent
+                )
+            await DB_WRITE.execute("PRAGMA foreign_keys=ON")
+        read = await _connect()
+        await read.execute("PRAGMA query_only=1")
+    except BaseException:
+        if read is not None:
+            await read.close()
+        await DB_WRITE.close()
+        raise
+    DB_READ = read
+
+
+async def close_db():
+    await DB_READ.close()
+    await DB_WRITE.close()
+
+
+_WRITE_LOCK = asyncio.Lock()
+
+
+@contextlib.asynccontextmanager
+async def write_tx():
+    # BEGIN IMMEDIATE takes the write lock up front instead of upgrading a
+    # deferred transaction; the asyncio lock keeps handlers sharing DB_WRITE
+    # from interleaving their transactions.
+    async with _WRITE_LOCK:
+        await DB_WRITE.execute("BEGIN IMMEDIATE")
+        try:
+            yield DB_WRITE
+        except BaseException:
+            await DB_WRITE.rollback()
+            raise
+        await DB_WRITE.commit()
+
+
+# In-stock listings per size; the catalog only changes through admin commands.
+_CATALOG_TTL = 60
+_CATALOG_CACHE: dict[str, tuple[float, list[aiosqlite.Row]]] = {}
+_CATALOG_LOCK = asyncio.Lock()
+# Bumped on every invalidation; a refill that started before one is dropped.
+_catalog_generation = 0
+
+
+def invalidate_catalog():
+    global _catalog_generation
+    _catalog_generation += 1
+    _CATALOG_CACHE.clear()
+    numbers_keyboard.cache_clear()
+
+
+def _row_to_bouquet(r) -> Bouquet:
+    # Row in Bouquet field order (see SQL_BY_NUM); in_stock comes back as 0/1.
+    return Bouquet(*r[:-1], bool(r[-1]))
+
+
+def _cached_listing(size: str) -> list[aiosqlite.Row] | None:
+    hit = _CATALOG_CACHE.get(size)
+    if hit and time.monotonic() - hit[0] < _CATALOG_TTL:
+        return hit[1]
+    return None
+
+
+async def get_in_stock_by_size(size: str) -> list[aiosqlite.Row]:
+    rows = _cached_listing(size)
+    if rows is not None:
+        return rows
+    # Only one handler refills the cache; concurrent misses wait and reuse it.
+    async with _CATALOG_LOCK:
+        rows = _cached_listing(size)
+        if rows is None:
+            generation = _catalog_generation
+            cur = await DB_READ.execute(SQL_IN_STOCK, (size,))
+            rows = await cur.fetchall()
+            if generation == _catalog_generation:
+                _CATALOG_CACHE[size] = (time.monotonic(), rows)
+    return rows
 
 
 async def get_bouquet_by_size_and_number(size: str, number: int) -> Bouquet | None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM bouquets WHERE size=? AND number=?", (size, number)
-        )
-        r = await cur.fetchone()
-    if not r:
-        return None
-    return Bouquet(
-        id=r["id"],
-        number=r["number"],
-        size=r["size"],
-        title=r["title"],
-        price_u=r["price_u"],
-        file_id=r["file_id"],
-        in_stock=bool(r["in_stock"]),
-    )
+    for r in _cached_listing(size) or ():
+        if r["number"] == number:
+            return Bouquet(
+                r["id"], number, size, r["title"], r["price_u"], r["file_id"], True
+            )
+    cur = await DB_READ.execute(SQL_BY_NUM, (size, number))
+    r = await cur.fetchone()
+    return _row_to_bouquet(r) if r else None
 
 
 async def create_order(
     user_id: int, bouquet_id: int, total_u: int, address: str, delivery_time: str
 ) -> str:
-    order_id = str(uuid.uuid4())
-    async with aiosqlite.connect(DB_PATH) as db:
+    order_id = secrets.token_hex(16)
+    async with write_tx() as db:
         await db.execute(
-            "INSERT INTO orders(id,user_id,bouquet_id,address,delivery_time,total_u,created_at) VALUES(?,?,?,?,?,?,?)",
+            SQL_INSERT_ORDER,
             (
                 order_id,
                 user_id,
@@ -192,24 +405,39 @@ async def create_order(
                 address,
                 delivery_time,
                 total_u,
-                datetime.utcnow().isoformat(),
             ),
         )
-        await db.commit()
     return order_id
 
 
-async def list_user_orders(user_id: int) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT o.id, o.status, o.total_u, o.created_at, b.title, b.size, b.number "
-            "FROM orders o JOIN bouquets b ON b.id = o.bouquet_id "
-            "WHERE o.user_id=? ORDER BY o.created_at DESC",
-            (user_id,),
+async def list_user_orders(user_id: int) -> list[str]:
+    """Latest orders of the user, already formatted for /myorders."""
+    cur = await DB_READ.execute(SQL_USER_ORDERS, (user_id,))
+    return [
+        ORDER_LINE(
+            id=oid[:8],
+            title=title,
+            hsize=HUMAN_SIZE[size],
+            num=num,
+            status=status,
+            total=total,
+            created=datetime.fromtimestamp(created, timezone.utc),
         )
-        rows = await cur.fetchall()
-    return [dict(r) for r in rows]
+        for oid, status, total, created, title, size, num in await cur.fetchall()
+    ]
+
+
+def _split_message(text: str, limit: int = TG_MESSAGE_LIMIT) -> list[str]:
+    """Split text on line breaks into chunks Telegram accepts."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
 
 
 # --- Handlers ---
@@ -217,21 +445,19 @@ async def list_user_orders(user_id: int) -> list[dict]:
 async def start(m: Message):
     await m.answer(
         "Hello! I'm the flower shop bot. Choose 👉 <b>Catalog</b>.",
-        reply_markup=main_menu(),
+        reply_markup=MAIN_MENU,
     )
 
 
 @router.message(F.text == "Catalog")
 async def show_sizes(m: Message, state: FSMContext):
     await state.clear()
-    await m.answer("Choose bouquet size:")
-    await m.answer("Sizes:", reply_markup=size_keyboard())
+    await m.answer("Choose bouquet size:", reply_markup=SIZE_KEYBOARD)
 
 
 @router.callback_query(F.data.startswith("size:"))
 async def picked_size(cb: CallbackQuery, state: FSMContext):
     size = cb.data.split(":", 1)[1]
-    await state.update_data(size=size)
     items = await get_in_stock_by_size(size)
     if not items:
         await cb.message.edit_text(
@@ -239,45 +465,66 @@ async def picked_size(cb: CallbackQuery, state: FSMContext):
         )
         return await cb.answer()
 
-    # Album without captions
-    media = [InputMediaPhoto(media=x.file_id) for x in items[:10]]
+    # Album without captions + price list (max 10 photos); picker offers up to 30
+    media, lines, numbers, picks = [], [], [], {}
+    for x in items[:30]:
+        if len(media) < 10:
+            media.append(_media(x["file_id"]))
+            lines.append(f"#{x['number']} — {x['title']} — ${x['price_u']}")
+        numbers.append(x["number"])
+        # Keyed by str so the state stays JSON-serializable for other storages
+        picks[str(x["number"])] = {
+            "id": x["id"],
+            "title": x["title"],
+            "price_u": x["price_u"],
+        }
+    # Set state first so the picker always has a handler, even if a send fails
+    await state.update_data(size=size, picks=picks)
+    await state.set_state(OrderStates.waiting_bouquet_number)
+
+    # Header first: if the edit fails, the fallback message must stay on top
     try:
         await cb.message.edit_text("Bouquets available:")
     except Exception:
         await cb.message.answer("Bouquets available:")
-    await cb.message.answer_media_group(media)
-
-    # Separate list with titles + prices
-    await cb.message.answer(
-        "\n".join([f"#{x.number} — {x.title} — ${x.price_u}" for x in items[:10]])
+    # Album and list with titles + prices in parallel
+    results = await asyncio.gather(
+        cb.message.answer_media_group(media),
+        cb.message.answer("\n".join(lines)),
+        return_exceptions=True,
     )
-
+    for r in results:
+        if isinstance(r, Exception):
+            logging.warning("Catalog send failed for size %s: %r", size, r)
+    # Picker goes last so it stays below the album and the list
     await cb.message.answer(
-        "Tap the bouquet number:",
-        reply_markup=numbers_keyboard([x.number for x in items[:30]]),
+        "Tap the bouquet number:", reply_markup=numbers_keyboard(tuple(numbers))
     )
-    await state.set_state(OrderStates.waiting_bouquet_number)
     await cb.answer()
 
 
 @router.callback_query(OrderStates.waiting_bouquet_number, F.data.startswith("pick:"))
 async def picked_number(cb: CallbackQuery, state: FSMContext):
     num = int(cb.data.split(":", 1)[1])
-    size = (await state.get_data()).get("size")
-    item = await get_bouquet_by_size_and_number(size, num)
-    if not item:
-        return await cb.answer("No such number", show_alert=True)
+    data = await state.get_data()
+    size = data.get("size")
+    item = data.get("picks", {}).get(str(num))
+    if item is None:  # state from before picks were stored: ask the DB
+        b = await get_bouquet_by_size_and_number(size, num)
+        if not b:
+            return await cb.answer("No such number", show_alert=True)
+        item = {"id": b.id, "title": b.title, "price_u": b.price_u}
     await state.update_data(
-        bouquet_id=item.id, bouquet_title=item.title, price_u=item.price_u
+        bouquet_id=item["id"], bouquet_title=item["title"], price_u=item["price_u"]
     )
     await cb.message.answer(
-        f"You chose: <b>#{item.number}</b> — {item.title}\nSize: {HUMAN_SIZE[item.size]}\nPrice: ${item.price_u}\n\nSend the delivery address:"
+        f"You chose: <b>#{num}</b> — {item['title']}\nSize: {HUMAN_SIZE[size]}\nPrice: ${item['price_u']}\n\nSend the delivery address:"
     )
     await state.set_state(OrderStates.waiting_address)
     await cb.answer()
 
 
-TIME_RE = re.compile(r"(today|tomorrow)?\s*([0-2]?\d:[0-5]\d)", re.IGNORECASE)
+TIME_RE = re.compile(r"(?:today|tomorrow)?\s*([0-2]?\d:[0-5]\d)")
 
 
 @router.message(OrderStates.waiting_address)
@@ -293,9 +540,9 @@ async def got_address(m: Message, state: FSMContext):
 @router.message(OrderStates.waiting_time)
 async def got_time(m: Message, state: FSMContext):
     t = m.text.strip()
-    if not TIME_RE.search(t):
+    if not TIME_RE.fullmatch(t.lower()):
         return await m.answer("Enter time in HH:MM (optionally 'today'/'tomorrow').")
-    data = await state.get_data()
+    data = await state.update_data(delivery_time=t)
     kb = InlineKeyboardBuilder()
     if PROVIDER_TOKEN:
         kb.button(text="Pay in Telegram", callback_data="pay:invoice")
@@ -305,7 +552,6 @@ async def got_time(m: Message, state: FSMContext):
         )
         kb.button(text="Confirm without payment (test)", callback_data="pay:test")
     kb.button(text="⬅️ Back", callback_data="pay:back")
-    await state.update_data(delivery_time=t)
     await m.answer(
         (
             f"<b>Check the order:</b>\n"
@@ -318,16 +564,14 @@ async def got_time(m: Message, state: FSMContext):
     )
 
 
-@router.callback_query(F.data == "pay:back")
 async def pay_back(cb: CallbackQuery, state: FSMContext):
     await cb.message.answer(
-        "OK, opened size selection again.", reply_markup=size_keyboard()
+        "OK, opened size selection again.", reply_markup=SIZE_KEYBOARD
     )
     await state.clear()
     await cb.answer()
 
 
-@router.callback_query(F.data == "pay:test")
 async def pay_test(cb: CallbackQuery, state: FSMContext):
     d = await state.get_data()
     order_id = await create_order(
@@ -335,13 +579,12 @@ async def pay_test(cb: CallbackQuery, state: FSMContext):
     )
     await cb.message.answer(
         f"Order <b>#{order_id[:8]}</b> created. Status: <b>awaiting payment</b> (test).",
-        reply_markup=main_menu(),
+        reply_markup=MAIN_MENU,
     )
     await state.clear()
     await cb.answer()
 
 
-@router.callback_query(F.data == "pay:invoice")
 async def pay_invoice(cb: CallbackQuery, state: FSMContext):
     if not PROVIDER_TOKEN:
         return await cb.answer("Payment provider not configured", show_alert=True)
@@ -363,6 +606,18 @@ async def pay_invoice(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
+PAY_ACTIONS = {"back": pay_back, "test": pay_test, "invoice": pay_invoice}
+
+
+# One filter for all pay:* buttons; the action is a dict lookup.
+@router.callback_query(F.data.startswith("pay:"))
+async def pay(cb: CallbackQuery, state: FSMContext):
+    action = PAY_ACTIONS.get(cb.data[len("pay:") :])
+    if action is None:
+        return await cb.answer()
+    await action(cb, state)
+
+
 @router.message(F.successful_payment)
 async def paid(m: Message, state: FSMContext):
     d = await state.get_data()
@@ -373,24 +628,17 @@ async def paid(m: Message, state: FSMContext):
     )
     await m.answer(
         f"Payment received! Order <b>#{order_id[:8]}</b> accepted.",
-        reply_markup=main_menu(),
+        reply_markup=MAIN_MENU,
     )
     await state.clear()
 
 
 @router.message(F.text == "My orders")
 async def my_orders(m: Message):
-    rows = await list_user_orders(m.from_user.id)
-    if not rows:
+    lines = await list_user_orders(m.from_user.id)
+    if not lines:
         return await m.answer("You have no orders yet.")
-    await m.answer(
-        "\n\n".join(
-            [
-                f"#<b>{r['id'][:8]}</b> — {r['title']} ({HUMAN_SIZE[r['size']]}, #{r['number']})\nStatus: {r['status']} • Total: ${r['total_u']} • {r['created_at'][:16]}"
-                for r in rows[:10]
-            ]
-        )
-    )
+    await m.answer("\n\n".join(lines))
 
 
 # --- Admin ---
@@ -398,12 +646,7 @@ async def my_orders(m: Message):
 async def admin(m: Message):
     if m.from_user.id not in ADMIN_IDS:
         return
-    kb = ReplyKeyboardBuilder()
-    kb.button(text="➕ Add bouquet")
-    kb.button(text="📦 Bouquet list")
-    kb.button(text="⬅️ Menu")
-    kb.adjust(2)
-    await m.answer("Admin panel:", reply_markup=kb.as_markup(resize_keyboard=True))
+    await m.answer("Admin panel:", reply_markup=ADMIN_MENU)
 
 
 class AdminStates(StatesGroup):
@@ -416,34 +659,26 @@ class AdminStates(StatesGroup):
 
 @router.message(F.text == "⬅️ Menu")
 async def back_menu(m: Message):
-    await m.answer("Main menu:", reply_markup=main_menu())
+    await m.answer("Main menu:", reply_markup=MAIN_MENU)
 
 
 @router.message(F.text == "📦 Bouquet list")
 async def admin_list(m: Message):
     if m.from_user.id not in ADMIN_IDS:
         return
-    out = []
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM bouquets ORDER BY size, number")
-        for r in await cur.fetchall():
-            mark = "✅" if r["in_stock"] else "❌"
-            out.append(
-                f"{mark} {r['size'].upper()} #{r['number']} — {r['title']} — ${r['price_u']} (id:{r['id']})"
-            )
-    await m.answer("\n".join(out) if out else "Catalog is empty.")
+    cur = await DB_READ.execute(SQL_ADMIN_LIST)
+    (text,) = await cur.fetchone()
+    if not text:
+        return await m.answer("Catalog is empty.")
+    for part in _split_message(text):
+        await m.answer(part)
 
 
 @router.message(F.text == "➕ Add bouquet")
 async def admin_add_start(m: Message, state: FSMContext):
     if m.from_user.id not in ADMIN_IDS:
         return
-    kb = InlineKeyboardBuilder()
-    for s in SIZES:
-        kb.button(text=HUMAN_SIZE[s], callback_data=f"admin:add:size:{s}")
-    kb.adjust(3)
-    await m.answer("Choose new bouquet size:", reply_markup=kb.as_markup())
+    await m.answer("Choose new bouquet size:", reply_markup=ADMIN_SIZE_KEYBOARD)
     await state.set_state(AdminStates.add_wait_size)
 
 
@@ -489,21 +724,21 @@ async def admin_add_price(m: Message, state: FSMContext):
 async def admin_add_photo(m: Message, state: FSMContext):
     d = await state.get_data()
     file_id = m.photo[-1].file_id
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
+    try:
+        async with write_tx() as db:
             await db.execute(
                 "INSERT INTO bouquets(number,size,title,price_u,file_id,in_stock) VALUES(?,?,?,?,?,1)",
                 (d["number"], d["size"], d["title"], d["price_u"], file_id),
             )
-            await db.commit()
-        except aiosqlite.IntegrityError:
-            await m.answer(
-                "Bouquet with this number already exists in this size.",
-                reply_markup=main_menu(),
-            )
-            await state.clear()
-            return
-    await m.answer("Added!", reply_markup=main_menu())
+    except aiosqlite.IntegrityError:
+        await m.answer(
+            "Bouquet with this number already exists in this size.",
+            reply_markup=MAIN_MENU,
+        )
+        await state.clear()
+        return
+    invalidate_catalog()
+    await m.answer("Added!", reply_markup=MAIN_MENU)
     await state.clear()
 
 
@@ -514,54 +749,38 @@ async def toggle_item(m: Message, command: CommandObject):
     if not command.args or not command.args.strip().isdigit():
         return await m.answer("Usage: /toggle <id>")
     item_id = int(command.args.strip())
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT in_stock FROM bouquets WHERE id=?", (item_id,))
-        row = await cur.fetchone()
-        if not row:
-            return await m.answer("Not found.")
-        new_val = 0 if row[0] else 1
-        await db.execute(
-            "UPDATE bouquets SET in_stock=? WHERE id=?", (new_val, item_id)
+    async with write_tx() as db:
+        cur = await db.execute(
+            "UPDATE bouquets SET in_stock = 1 - in_stock WHERE id=? RETURNING in_stock",
+            (item_id,),
         )
-        await db.commit()
-    await m.answer(f"in_stock toggled to {new_val} for id={item_id}")
+        row = await cur.fetchone()
+    if not row:
+        return await m.answer("Not found.")
+    invalidate_catalog()
+    await m.answer(f"in_stock toggled to {row[0]} for id={item_id}")
+
+
+SQL_SEED_INSERT = (
+    "INSERT OR IGNORE INTO bouquets(number,size,title,price_u,file_id,in_stock) VALUES "
+)
+DEMO_BOUQUETS = (
+    (1, "small", "Bouquet of Peonies", 45, "AgACAgIAAxkBAAIBQ2ZfXXXXXXX1"),
+    (2, "small", "Bouquet of Spray Roses", 60, "AgACAgIAAxkBAAIBQmZfXXXXXXX2"),
+    (3, "medium", "Bouquet of Garden Roses", 75, "AgACAgIAAxkBAAIBRWZfXXXXXXX3"),
+)
 
 
 @router.message(Command("seed"))
 async def seed(m: Message):
     if m.from_user.id not in ADMIN_IDS:
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executemany(
-            "INSERT OR IGNORE INTO bouquets(number,size,title,price_u,file_id,in_stock) VALUES(?,?,?,?,?,1)",
-            [
-                (
-                    1,
-                    "small",
-                    "Bouquet of Peonies",
-                    45,
-                    "AgACAgIAAxkBAAIBQ2ZfXXXXXXX1",
-                    1,
-                ),
-                (
-                    2,
-                    "small",
-                    "Bouquet of Spray Roses",
-                    60,
-                    "AgACAgIAAxkBAAIBQmZfXXXXXXX2",
-                    1,
-                ),
-                (
-                    3,
-                    "medium",
-                    "Bouquet of Garden Roses",
-                    75,
-                    "AgACAgIAAxkBAAIBRWZfXXXXXXX3",
-                    1,
-                ),
-            ],
-        )
-        await db.commit()
+    # One multi-row INSERT instead of a statement execution per row.
+    sql = SQL_SEED_INSERT + ",".join(["(?,?,?,?,?,1)"] * len(DEMO_BOUQUETS))
+    params = [v for row in DEMO_BOUQUETS for v in row]
+    async with write_tx() as db:
+        await db.execute(sql, params)
+    invalidate_catalog()
     await m.answer("Demo bouquets added. Replace file_id with real photos.")
 
 
@@ -569,13 +788,21 @@ async def on_startup():
     await init_db()
 
 
+async def on_shutdown():
+    await close_db()
+
+
 async def main():
+    if hasattr(asyncio, "eager_task_factory"):  # Python 3.12+
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
     await on_startup()
+    dp.shutdown.register(on_shutdown)
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
+    run = uvloop.run if uvloop else asyncio.run
     try:
-        asyncio.run(main())
+        run(main())
     except (KeyboardInterrupt, SystemExit):
         pass